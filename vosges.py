@@ -2,44 +2,122 @@ import os
 import re
 import sys
 import imp
+import gzip
 import math
 import copy
 import json
 import time
+import Queue
 import errno
+import bisect
+import ctypes
+import select
 import shutil
+import socket
+import struct
+import sqlite3
 import hashlib
+import cProfile
+import urlparse
 import argparse
+import threading
 import traceback
 import functools
 import itertools
 import subprocess
+import ctypes.util
+import contextlib
+import collections
+import SocketServer
+import BaseHTTPServer
 import xml.dom.minidom
 
 __tool_name__ = 'vosges'
 
+class Profile:
+	histogram_buckets_ms = [1, 10, 100, 1000, 10000]
+	timings = {}
+	counters = {}
+
+	@staticmethod
+	def count(counter, n = 1):
+		Profile.counters[counter] = Profile.counters.get(counter, 0) + n
+
+	@staticmethod
+	def record(name, ms):
+		timing = Profile.timings.setdefault(name, dict(calls = 0, total_ms = 0.0, max_ms = 0.0, histogram_ms = [0] * (1 + len(Profile.histogram_buckets_ms))))
+		timing['calls'] += 1
+		timing['total_ms'] += ms
+		timing['max_ms'] = max(timing['max_ms'], ms)
+		timing['histogram_ms'][bisect.bisect_right(Profile.histogram_buckets_ms, ms)] += 1
+
+	@staticmethod
+	def timed(name):
+		def decorator(f):
+			@functools.wraps(f)
+			def timed_f(*args, **kwargs):
+				tic = time.time()
+				try:
+					return f(*args, **kwargs)
+				finally:
+					Profile.record(name, 1000.0 * (time.time() - tic))
+			return timed_f
+		return decorator
+
+	@staticmethod
+	def stats():
+		histogram_labels = ['<%d' % ms for ms in Profile.histogram_buckets_ms] + ['>=%d' % Profile.histogram_buckets_ms[-1]]
+		return dict([('profile_' + counter, n) for counter, n in Profile.counters.items()] + [('profile_' + name, dict(timing, total_ms = round(timing['total_ms'], 1), max_ms = round(timing['max_ms'], 1), histogram_ms = dict(zip(histogram_labels, timing['histogram_ms'])))) for name, timing in Profile.timings.items()])
+
 class P:
 	project_page = 'http://github.com/vadimkantorov/%s' % __tool_name__
 	bugreport_page = os.path.join(project_page, 'issues') 
 	jobdir = staticmethod(lambda group: os.path.join(P.job, group.name))
 	logdir = staticmethod(lambda group: os.path.join(P.log, group.name))
+	logshard = staticmethod(lambda group, name: os.path.join(P.logdir(group), *[hashlib.md5(name).hexdigest()[2 * level : 2 * level + 2] for level in range(P.shard_levels.get(group.name, 0))]))
+	shard_max_files = 1024
+	shard_levels_for = staticmethod(lambda num_files: 0 if num_files <= P.shard_max_files else 1 + P.shard_levels_for(num_files / 256)) # each level fans out 256 ways, so a leaf holds at most shard_max_files files on average
 	sgejobdir = staticmethod(lambda group: os.path.join(P.sgejob, group.name))
 	
 	jobfile = staticmethod(lambda job: os.path.join(P.jobdir(job.group), 'job_%s.sh' % job.name))
-	joblogfiles = staticmethod(lambda job: (os.path.join(P.logdir(job.group), 'stdout_job_%s.txt' % job.name), os.path.join(P.logdir(job.group), 'stderr_job_%s.txt' % job.name)))
+	joblogfiles = staticmethod(lambda job: (os.path.join(P.logshard(job.group, job.name), 'stdout_job_%s.txt' % job.name), os.path.join(P.logshard(job.group, job.name), 'stderr_job_%s.txt' % job.name)))
 	
 	sgejobfile = staticmethod(lambda group, sgejob_idx: os.path.join(P.sgejobdir(group), 'sge_%06d.sh' % sgejob_idx))
-	sgejoblogfiles = staticmethod(lambda group, sgejob_idx: (os.path.join(P.logdir(group), 'stdout_sge_%06d.txt' % sgejob_idx), os.path.join(P.logdir(group), 'stderr_sge_%06d.txt' % sgejob_idx)))
+	sgejobname = staticmethod(lambda group, sgejob_idx: '%s_%s_%s' % (P.experiment_name_code, group.name, sgejob_idx))
+	sgejoblogfiles = staticmethod(lambda group, sgejob_idx: (os.path.join(P.logshard(group, 'sge_%06d' % sgejob_idx), 'stdout_sge_%06d.txt' % sgejob_idx), os.path.join(P.logshard(group, 'sge_%06d' % sgejob_idx), 'stderr_sge_%06d.txt' % sgejob_idx)))
 	
 	explogfiles = staticmethod(lambda: (os.path.join(P.log, 'stdout_experiment.txt'), os.path.join(P.log, 'stderr_experiment.txt')))
+	profile_file = staticmethod(lambda: os.path.join(P.log, 'profile_experiment.prof'))
+	layout_file = staticmethod(lambda: os.path.join(P.log, 'layout.txt'))
+	compressed_file = staticmethod(lambda file_path: file_path + '.gz')
+	existing_files = staticmethod(lambda file_path: filter(os.path.exists, [P.compressed_file(file_path), file_path])) # a plain file next to the .gz holds lines appended after compression
 
 	@staticmethod
+	@Profile.timed('P.read_or_empty')
 	def read_or_empty(file_path):
 		#subprocess.check_call(['touch', file_path]) # workaround for NFS caching
+		content = ''
+		for existing_file_path in P.existing_files(file_path):
+			with (open if existing_file_path == file_path else gzip.open)(existing_file_path, 'r') as f:
+				content += f.read()
+		Profile.count('bytes_read', len(content))
+		return content
+
+	@staticmethod
+	def file_size(file_path):
+		if not file_path.endswith('.gz'):
+			return os.path.getsize(file_path)
+		with open(file_path, 'rb') as f:
+			f.seek(-4, os.SEEK_END)
+			return struct.unpack('<I', f.read(4))[0] # gzip ISIZE trailer, exact for the single-member files written by P.compress
+
+	@staticmethod
+	def compress(file_path):
 		if os.path.exists(file_path):
-			with open(file_path, 'r') as f:
-				return f.read()
-		return ''
+			with open(file_path, 'rb') as f_in, gzip.open(P.compressed_file(file_path) + '.tmp', 'wb') as f_out:
+				shutil.copyfileobj(f_in, f_out)
+			os.rename(P.compressed_file(file_path) + '.tmp', P.compressed_file(file_path))
+			os.remove(file_path)
 
 	@staticmethod
 	def init(config, experiment_script):
@@ -53,21 +131,54 @@ class P:
 		P.html_root = config.html_root or os.path.join(P.root, 'html')
 		P.archive_root = config.archive_root or os.path.join(P.root, 'archive')
 		P.html_report_file_path = os.path.join(P.html_root, P.experiment_name_code + '.html')
-		P.archive_report_file_path = staticmethod(lambda experiment_status, localtime: os.path.join(P.archive_root, '%s_%s_%s.html' % (P.experiment_name_code, experiment_status, time.strftime(config.strftime, localtime))))
-		P.html_report_url = os.path.join(config.html_root_alias or P.html_root, P.html_report_file_name)
+		P.archive_report_file_path = staticmethod(lambda run_id, experiment_status: os.path.join(P.archive_root, '%s_%06d_%s.html' % (P.experiment_name_code, run_id, experiment_status)))
+		P.archive_blob_file = staticmethod(lambda digest: os.path.join(P.archive_root, 'objects', digest[:2], digest[2:]))
+		P.archive_index_file = os.path.join(P.archive_root, 'index.sqlite')
+		P.html_report_url = os.path.join(config.html_root_alias or P.html_root, os.path.basename(P.html_report_file_path))
 
 		P.experiment_root = os.path.join(P.root, P.experiment_name_code)
 		P.log = os.path.join(P.experiment_root, 'log')
 		P.job = os.path.join(P.experiment_root, 'job')
 		P.sgejob = os.path.join(P.experiment_root, 'sge')
+		P.shard_levels = {group_name : int(levels) for group_name, levels in [line.rsplit(' ', 1) for line in P.read_or_empty(P.layout_file()).splitlines()]}
+		P.snapshot_file = os.path.join(P.experiment_root, 'experiment.json')
+		P.canceled_file = os.path.join(P.experiment_root, 'canceled.txt')
+		P.snapshot_key = staticmethod(lambda: hashlib.md5(P.read_or_empty(P.experiment_script) + P.read_or_empty(P.rcfile)).hexdigest())
 		P.all_dirs = [P.root, P.experiment_root, P.log, P.job, P.sgejob, P.html_root, P.archive_root]
 
 class Q:
+	daemon_socket = None
+
+	@staticmethod
+	def call_daemon(method, **kwargs):
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			sock.connect(Q.daemon_socket)
+			f = sock.makefile('r+')
+			f.write(json.dumps(dict(kwargs, method = method, experiment = getattr(P, 'experiment_name_code', None))) + '\n')
+			f.flush()
+			response = json.loads(f.readline() or '{"error" : "connection closed"}')
+		finally:
+			sock.close()
+		if 'error' in response:
+			raise RuntimeError('%s daemon failed to execute %s: %s' % (__tool_name__, method, response['error']))
+		return response['result']
+
+	@staticmethod
+	def connect_daemon(daemon_socket):
+		Q.daemon_socket = daemon_socket
+		try:
+			Q.call_daemon('ping')
+		except socket.error:
+			print '%s daemon is not running at %s, using qsub / qstat / qdel directly.' % (__tool_name__, daemon_socket)
+			Q.daemon_socket = None
+
 	@staticmethod
 	def retry(f, stderr):
 		def safe_f(*args, **kwargs):
 			while True:
 				try:
+					Profile.count('subprocess_forks')
 					return f(*args, **kwargs)
 				except subprocess.CalledProcessError, err:
 					print >> (stderr or sys.stderr), '\nRetrying. Got CalledProcessError while calling %s:\nreturncode: %d\ncmd: %s\noutput: %s\n\n' % (f, err.returncode, err.cmd, err.output)
@@ -76,13 +187,28 @@ class Q:
 		return safe_f
 
 	@staticmethod
+	def qstat(stderr = None):
+		return [(int(elem.getElementsByTagName('JB_job_number')[0].firstChild.data), elem.getElementsByTagName('JB_name')[0].firstChild.data) for elem in xml.dom.minidom.parseString(Q.retry(subprocess.check_output, stderr = stderr)(['qstat', '-xml'], stderr = stderr)).documentElement.getElementsByTagName('job_list')]
+
+	@staticmethod
+	def get_named_jobs(job_name_prefix, stderr = None):
+		if Q.daemon_socket:
+			return map(tuple, Q.call_daemon('get_jobs', job_name_prefix = job_name_prefix))
+		return [(job_id, job_name) for job_id, job_name in Q.qstat(stderr = stderr) if job_name.startswith(job_name_prefix)]
+
+	@staticmethod
+	@Profile.timed('Q.get_jobs')
 	def get_jobs(job_name_prefix, stderr = None):
-		return [int(elem.getElementsByTagName('JB_job_number')[0].firstChild.data) for elem in xml.dom.minidom.parseString(Q.retry(subprocess.check_output, stderr = stderr)(['qstat', '-xml'], stderr = stderr)).documentElement.getElementsByTagName('job_list') if elem.getElementsByTagName('JB_name')[0].firstChild.data.startswith(job_name_prefix)]
+		return [job_id for job_id, job_name in Q.get_named_jobs(job_name_prefix, stderr = stderr)]
 	
 	@staticmethod
+	@Profile.timed('Q.submit_job')
 	def submit_job(sgejob_file, sgejob_name, stderr = None):
+		if Q.daemon_socket:
+			return Q.call_daemon('submit_job', sgejob_file = sgejob_file, sgejob_name = sgejob_name)
 		while True:
 			try:
+				Profile.count('subprocess_forks')
 				return int(subprocess.check_output(['qsub', '-N', sgejob_name, '-terse', sgejob_file], stderr = stderr))
 			except subprocess.CalledProcessError, err:
 				jobs = Q.get_jobs(sgejob_name, stderr = stderr)
@@ -90,9 +216,79 @@ class Q:
 					return jobs[0]
 
 	@staticmethod
-	def delete_jobs(jobs, stderr = None):
-		if jobs:
-			Q.retry(subprocess.check_call, stderr = stderr)(['qdel'] + map(str, jobs), stdout = stderr, stderr = stderr)
+	def delete_jobs(jobs, stderr = None, chunk_size = 500, num_threads = 4):
+		def qdel(chunks):
+			for chunk in chunks:
+				Profile.count('subprocess_forks')
+				subprocess.call(['qdel'] + map(str, chunk), stdout = stderr, stderr = stderr) # jobs that already left the queue make qdel fail, callers re-check with qstat
+
+		if jobs and Q.daemon_socket:
+			Q.call_daemon('delete_jobs', jobs = jobs)
+		elif jobs:
+			chunks = [jobs[i : i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+			threads = [threading.Thread(target = qdel, args = (chunks[k::num_threads], )) for k in range(min(num_threads, len(chunks)))]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+
+class Watcher:
+	IN_MODIFY, IN_CLOSE_WRITE, IN_CREATE, IN_Q_OVERFLOW = 0x2, 0x8, 0x100, 0x4000
+	remote_filesystems = ['nfs', 'nfs4', 'cifs', 'smbfs', 'lustre', 'gpfs', 'fuse.sshfs']
+
+	def __init__(self, dirs, backend, seconds_min, seconds_max, accept = lambda file_name: True):
+		self.seconds_min, self.seconds_max, self.seconds = seconds_min, seconds_max, seconds_min
+		self.accept, self.last_wait = accept, 0
+		self.fd, self.wd2dir = None, {}
+		if backend == 'inotify' or (backend == 'auto' and not any([Watcher.filesystem_type(d) in Watcher.remote_filesystems for d in dirs])):
+			try:
+				self.fd, self.wd2dir = Watcher.inotify(dirs)
+			except (OSError, AttributeError):
+				pass
+		self.backend = 'inotify' if self.fd != None else 'poll'
+
+	@staticmethod
+	def filesystem_type(path):
+		path = os.path.realpath(path)
+		mounts = [line.split()[1:3] for line in P.read_or_empty('/proc/mounts').splitlines()]
+		return max([(len(mount_point), fs_type) for mount_point, fs_type in mounts if path == mount_point or path.startswith(mount_point.rstrip('/') + '/')] or [(0, None)])[1]
+
+	@staticmethod
+	def inotify(dirs):
+		libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+		fd = libc.inotify_init()
+		if fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init failed')
+		wd2dir = {}
+		for d in dirs:
+			wd = libc.inotify_add_watch(fd, d, Watcher.IN_MODIFY | Watcher.IN_CLOSE_WRITE | Watcher.IN_CREATE)
+			if wd < 0:
+				os.close(fd)
+				raise OSError(ctypes.get_errno(), 'inotify_add_watch failed for %s' % d)
+			wd2dir[wd] = d
+		return fd, wd2dir
+
+	def wait(self, block = True, backoff = False):
+		if self.fd == None:
+			if block:
+				self.seconds = min(2 * self.seconds, self.seconds_max) if backoff else self.seconds_min
+				time.sleep(self.seconds)
+			return None if block else set()
+
+		if block:
+			time.sleep(max(0, self.last_wait + self.seconds_min - time.time())) # debounce, events accumulate in the kernel meanwhile
+		changed_paths, overflow, deadline = set(), False, time.time() + (self.seconds_max if block else 0)
+		while select.select([self.fd], [], [], 0 if changed_paths or overflow else max(0, deadline - time.time()))[0]:
+			events, offset = os.read(self.fd, 65536), 0
+			while offset < len(events):
+				wd, mask, cookie, name_len = struct.unpack_from('iIII', events, offset)
+				file_name = events[offset + 16 : offset + 16 + name_len].rstrip('\0')
+				if self.accept(file_name):
+					changed_paths.add(os.path.join(self.wd2dir.get(wd, ''), file_name))
+				overflow = overflow or bool(mask & Watcher.IN_Q_OVERFLOW)
+				offset += 16 + name_len
+		self.last_wait = time.time()
+		return None if overflow else changed_paths
 
 class Path(str):
 	def __new__(cls, *path_parts, **kwargs):
@@ -118,8 +314,10 @@ class ExecutionStatus:
 	killed = 'killed'
 
 	failed = [error, killed, canceled]
+	crashed = [error, killed]
 	enqueued = [submitted, running]
-	processed = [success, running, canceled, erorr, killed]
+	processed = [success, running, canceled, error, killed]
+	completed = [success, error, killed]
 
 	domination_lattice = {
 		waiting : [],
@@ -156,6 +354,53 @@ class Magic(str):
 	results = lambda self: self.findall_and_load_arg(Magic.action_results)
 	status = lambda self: (self.findall_and_load_arg(Magic.action_status, default = None) or [None])[-1]
 
+class Aggregate:
+	def __init__(self):
+		self.time_wall_clock_seconds, self.rss_max_kbytes, self.time_queue_wait_seconds = [], [], []
+		self.time_cpu_seconds, self.time_cpu_wall_clock_seconds = 0.0, 0.0
+		self.time_started_unix, self.time_finished_unix = None, None
+		self.num_jobs = 0
+
+	@staticmethod
+	def number(stats, key):
+		try:
+			return float(stats[key])
+		except (KeyError, TypeError, ValueError):
+			return None
+
+	def add(self, stats):
+		wall_clock, user, system, rss_max, submitted, started, finished = [Aggregate.number(stats, key) for key in ['time_wall_clock_seconds', 'time_user_seconds', 'time_system_seconds', 'rss_max_kbytes', 'time_submitted_unix', 'time_started_unix', 'time_finished_unix']]
+		self.num_jobs += 1
+		for values, value in [(self.time_wall_clock_seconds, wall_clock), (self.rss_max_kbytes, rss_max), (self.time_queue_wait_seconds, started - submitted if started != None and submitted != None else None)]:
+			if value != None:
+				bisect.insort(values, value)
+		if wall_clock and user != None and system != None:
+			self.time_cpu_seconds += user + system
+			self.time_cpu_wall_clock_seconds += wall_clock
+		if started != None:
+			self.time_started_unix = min(self.time_started_unix, started) if self.time_started_unix != None else started
+		if finished != None:
+			self.time_finished_unix = max(self.time_finished_unix, finished) if self.time_finished_unix != None else finished
+
+	def stats(self, num_jobs_remaining):
+		percentile = lambda values, q: values[max(0, int(math.ceil(q * len(values))) - 1)] if values else None
+		elapsed_hours = (self.time_finished_unix - self.time_started_unix) / 3600.0 if self.time_started_unix != None and self.time_finished_unix != None else None
+		throughput = self.num_jobs / elapsed_hours if elapsed_hours else None
+		return {
+			'jobs_completed' : self.num_jobs,
+			'time_wall_clock_min_seconds' : percentile(self.time_wall_clock_seconds, 0.0),
+			'time_wall_clock_median_seconds' : percentile(self.time_wall_clock_seconds, 0.5),
+			'time_wall_clock_p95_seconds' : percentile(self.time_wall_clock_seconds, 0.95),
+			'time_wall_clock_max_seconds' : percentile(self.time_wall_clock_seconds, 1.0),
+			'time_queue_wait_median_seconds' : percentile(self.time_queue_wait_seconds, 0.5),
+			'time_queue_wait_max_seconds' : percentile(self.time_queue_wait_seconds, 1.0),
+			'rss_max_kbytes' : percentile(self.rss_max_kbytes, 1.0),
+			'rss_median_kbytes' : percentile(self.rss_max_kbytes, 0.5),
+			'cpu_efficiency' : round(self.time_cpu_seconds / self.time_cpu_wall_clock_seconds, 3) if self.time_cpu_wall_clock_seconds else None,
+			'throughput_jobs_per_hour' : round(throughput, 2) if throughput else None,
+			'time_eta_seconds' : 3600.0 * num_jobs_remaining / throughput if throughput and num_jobs_remaining else None
+		}
+
 class Exec:
 	def __init__(self, executor, script_path = '', script_args = '', command_line_options = ''):
 		self.executor = executor
@@ -186,6 +431,7 @@ class JobGroup(JobOptions):
 		self.name = name
 		self.qualified_name = '/' + name
 		self.jobs = []
+		self.aggregate = Aggregate()
 
 class Job(JobOptions):
 	def __init__(self, name, group, **kwargs):
@@ -202,6 +448,7 @@ class Experiment:
 		self.qualified_name = '/'
 		self.jobs = []
 		self.groups = []
+		self.aggregate = Aggregate()
 
 	normalize_name = staticmethod(lambda name: '_'.join(map(str, name)) if isinstance(name, tuple) else str(name))
 	resolve_dependency = lambda self, dep: dep if isinstance(dep, Job) or isinstance(dep, JobGroup) else self.find(dep) if isinstance(dep, str) else self.find('/%s/%s' % tuple(map(Experiment.normalize_name, dep)))
@@ -226,10 +473,159 @@ class Experiment:
 	def find(self, xpath):
 		return (filter(lambda obj: obj.qualified_name == '/' + xpath.lstrip('/'), self.jobs + self.groups + [self]) or [None])[0]
 
+	def save(self, file_path, key):
+		options = lambda obj: dict([(k, v) for k, v in vars(obj).items() if k not in ['name', 'qualified_name', 'group', 'jobs', 'status', 'aggregate']], dependencies = [dep.qualified_name for dep in obj.dependencies], executable = obj.executable and vars(obj.executable))
+		with open(file_path, 'w') as f:
+			json.dump({
+				'key' : key,
+				'experiment_name' : self.experiment_name,
+				'groups' : [{'name' : group.name, 'options' : options(group)} for group in self.groups],
+				'jobs' : [{'name' : job.name, 'group' : job.group.qualified_name, 'options' : options(job)} for job in self.jobs]
+			}, f, default = str)
+
+	@staticmethod
+	def load(file_path, key):
+		if not os.path.exists(file_path):
+			return None
+		with open(file_path, 'r') as f:
+			snapshot = json.load(f)
+		if snapshot['key'] != key:
+			return None
+
+		e, objs = Experiment(str(snapshot['experiment_name'])), {}
+		for serialized in snapshot['groups'] + snapshot['jobs']:
+			obj = Job(str(serialized['name']), objs[serialized['group']]) if 'group' in serialized else JobGroup(str(serialized['name']))
+			vars(obj).update(serialized['options'], executable = serialized['options']['executable'] and Exec(**serialized['options']['executable']))
+			if isinstance(obj, Job):
+				obj.group.jobs.append(obj)
+				e.jobs.append(obj)
+			else:
+				e.groups.append(obj)
+			objs[obj.qualified_name] = obj
+		for obj in objs.values():
+			obj.dependencies = [objs[qualified_name] for qualified_name in obj.dependencies]
+		return e
+
+	def collect(self, job, stats):
+		for aggregate in [job.group.aggregate, self.aggregate]:
+			aggregate.add(stats)
+
+	def select(self, obj = None):
+		return obj.jobs if isinstance(obj, JobGroup) else [obj] if isinstance(obj, Job) else self.jobs if obj in [None, self] else []
+
 	def status(self, obj = None):
-		return reduce(ExecutionStatus.reduce, [job.status for job in self.jobs if job == obj or job.group == obj or obj == None])
+		return reduce(ExecutionStatus.reduce, [job.status for job in self.select(obj)])
+
+def report(config, e, xpath = '/', logs = True, children = True, live = False):
+	sgejoblogfiles = lambda group: [P.sgejoblogfiles(group, sgejob_idx) for sgejob_idx in range(len(group.jobs))]
+	sgejobfile = lambda group: [P.sgejobfile(group, sgejob_idx) for sgejob_idx in range(len(group.jobs))]
+	read_text = P.read_or_empty if logs else lambda file_path: None
+	
+	truncate_stdout = lambda stdout: stdout[:config.max_stdout_size / 2] + '\n\n[%d characters skipped]\n\n' % (len(stdout) - 2 * (config.max_stdout_size / 2)) + stdout[-(config.max_stdout_size / 2):] if stdout != None and len(stdout) > config.max_stdout_size else stdout
+
+	def put_extra_job_stats(report_job):
+		if report_job['status'] == ExecutionStatus.running and 'time_started_unix' in report_job['stats']:
+			report_job['stats']['time_wall_clock_seconds'] = int(time.time()) - int(report_job['stats']['time_started_unix'])
+		return report_job
+
+	num_jobs_remaining = lambda jobs: len([job for job in jobs if job.status in [ExecutionStatus.waiting] + ExecutionStatus.enqueued])
+
+	def put_extra_group_stats(report_group, group):
+		report_group['stats'].update(group.aggregate.stats(num_jobs_remaining(group.jobs)))
+		return report_group
+
+	def process_results(results):
+		processed_results = []
+		for i, r in enumerate(results):
+			if not isinstance(r, dict):
+				r = {'type' : 'text', 'path' : r}
+			if r.get('name') == None and r.get('path') != None:
+				r['name'] = os.path.basename(r['path'])
+			if r['type'] == 'text' and r.get('value') == None and r.get('path') != None:
+				r['value'] = P.read_or_empty(r['path'])
+			if r.get('name') == None:
+				r['name'] = '#' + i
+			processed_results = filter(lambda rr: rr['name'] != r['name'], processed_results) + [r]
+		return sorted(processed_results, key = lambda item: item['name'])
 
-def status(config, e = None, xpath = None, html = False, print_html_report_location = False):
+	def report_job(job):
+		if live:
+			return {'name' : job.name, 'qualified_name' : job.qualified_name, 'group' : job.group.name, 'status' : job.status, 'stats' : {}}
+
+		job_stderr = Magic(P.read_or_empty(P.joblogfiles(job)[1]))
+		return put_extra_job_stats({
+			'name' : job.name,
+			'qualified_name' : job.qualified_name, 
+			'group' : job.group.name,
+			'stdout' : truncate_stdout(read_text(P.joblogfiles(job)[0])),
+			'stdout_path' : P.joblogfiles(job)[0],
+			'stderr' : job_stderr if logs else None, 
+			'stderr_path' : P.joblogfiles(job)[1],
+			'script' : read_text(P.jobfile(job)),
+			'script_path' : P.jobfile(job),
+			'status' : job.status, 
+			'environ' : job_stderr.environ(),
+			'env' : job.env,
+			'results' : process_results(job_stderr.results()),
+			'stats' : job_stderr.stats()
+		})
+
+	def report_group(group, report_jobs):
+		return put_extra_group_stats({
+			'name' : group.name,
+			'qualified_name' : group.qualified_name, 
+			'stdout' : logs and '\n'.join(map(read_text, zip(*sgejoblogfiles(group))[0])).strip(),
+			'stdout_path' : None if live else '\n'.join(zip(*sgejoblogfiles(group))[0]),
+			'stderr' : logs and '\n'.join(map(read_text, zip(*sgejoblogfiles(group))[1])).strip(),
+			'stderr_path' : None if live else '\n'.join(zip(*sgejoblogfiles(group))[1]),
+			'env' : group.env,
+			'script' : logs and '\n'.join(map(read_text, sgejobfile(group))),
+			'status' : e.status(group),
+			'status_hint' : ('%d / %d' % ([job.status for job in group.jobs].count(ExecutionStatus.success), len(group.jobs))) if any([job.status in ExecutionStatus.processed for job in group.jobs]) else '',
+			'stats' : {
+				'mem_lo_gb' : group.mem_lo_gb, 
+				'mem_hi_gb' : group.mem_hi_gb,
+			},
+			'jobs' : report_jobs,
+		}, group)
+
+	def report_experiment(report_groups):
+		experiment_stderr = Magic(P.read_or_empty(P.explogfiles()[1]))
+		return {
+			'qualified_name' : '/',
+			'name' : e.experiment_name, 
+			'stdout' : read_text(P.explogfiles()[0]), 
+			'stdout_path' : P.explogfiles()[0],
+			'stderr' : experiment_stderr if logs else None, 
+			'stderr_path' : P.explogfiles()[1],
+			'script' : read_text(P.experiment_script), 
+			'script_path' : os.path.abspath(P.experiment_script),
+			'rcfile' : read_text(P.rcfile) if P.rcfile != None else None,
+			'rcfile_path' : P.rcfile,
+			'environ' : experiment_stderr.environ(),
+			'env' : config.default_job_options.env,
+			'stats' : dict({
+				'experiment_root' : P.experiment_root,
+				'experiment_script' : os.path.abspath(P.experiment_script),
+				'rcfile' : P.rcfile,
+				'name_code' : P.experiment_name_code, 
+				'html_root' : P.html_root,
+				'html_root_alias' : config.html_root_alias,
+				'argv_joined' : ' '.join(['"%s"' % arg if ' ' in arg else arg for arg in sys.argv])}.items() +
+				{'default_job_options.' + k : v for k, v in vars(config.default_job_options).items()}.items() +
+				experiment_stderr.stats().items() +
+				e.aggregate.stats(num_jobs_remaining(e.jobs)).items()
+			),
+			'groups' : report_groups,
+			'index' : dict([(group.qualified_name, (group_idx, None)) for group_idx, group in enumerate(e.groups)] + [(job.qualified_name, (group_idx, job_idx)) for group_idx, group in enumerate(e.groups) for job_idx, job in enumerate(group.jobs)])
+		}
+
+	obj = e.find(xpath)
+	summary = lambda objs: [{'qualified_name' : obj.qualified_name} for obj in objs]
+	return report_job(obj) if isinstance(obj, Job) else report_group(obj, map(report_job, obj.jobs) if children else summary(obj.jobs)) if isinstance(obj, JobGroup) else report_experiment([report_group(group, map(report_job, group.jobs)) for group in e.groups] if children else summary(e.groups)) if obj == e else {'error' : 'not found: %s' % xpath}
+
+@Profile.timed('status')
+def status(config, e = None, xpath = None, html = False, print_html_report_location = False, live = False, restored = None):
 	HTML_PATTERN = '''
 <!DOCTYPE html>
 
@@ -405,8 +801,8 @@ def status(config, e = None, xpath = None, html = False, print_html_report_locat
 			</div>
 		</nav>
 		<script type="text/javascript">
-			var stats_keys_reduced_experiment = ['name_code', 'time_started', 'time_finished'];
-			var stats_keys_reduced_group = ['time_wall_clock_avg_seconds'];
+			var stats_keys_reduced_experiment = ['name_code', 'time_started', 'time_finished', 'throughput_jobs_per_hour', 'time_eta_seconds'];
+			var stats_keys_reduced_group = ['time_wall_clock_median_seconds', 'time_wall_clock_p95_seconds', 'rss_max_kbytes', 'cpu_efficiency', 'throughput_jobs_per_hour', 'time_eta_seconds'];
 			var stats_keys_reduced_job = ['exit_code', 'time_wall_clock_seconds'];
 			var environ_keys_reduced = ['USER', 'PWD', 'HOME', 'HOSTNAME', 'CUDA_VISIBLE_DEVICES', 'JOB_ID', 'PATH', 'LD_LIBRARY_PATH'];
 
@@ -439,13 +835,18 @@ def status(config, e = None, xpath = None, html = False, print_html_report_locat
 					}
 				});
 
-				$(window).on('hashchange', function() {
+				var lookup = function(qualified_name) {
+					var ref = report.index[qualified_name] || [];
+					var group = ref[0] != undefined ? report.groups[ref[0]] : undefined;
+					return {group : group, job : group && ref[1] != undefined ? group.jobs[ref[1]] : undefined};
+				};
+
+				var render = function() {
 					var parsed_location = /\#(?:\/([^\/]+))?(?:\/(.+))?/.exec(window.location.hash) || [];
 					var group_name = parsed_location[1], job_name = parsed_location[2];
 
-					var ref = report.index[window.loation.hash]
-					var group = ref[0] && report.groups[ref[0]]
-					var job = group && ref[1] && group.jobs[ref[1]]
+					var selected = lookup(window.location.hash.slice(1));
+					var group = selected.group, job = selected.job;
 					var group_jobs = group && group.jobs
 
 					$('#lnkExpName').html(report.name);
@@ -453,110 +854,53 @@ def status(config, e = None, xpath = None, html = False, print_html_report_locat
 					$('#divJobs').html($('#tmplGroupsJobs').render(group ? group_jobs : report.jobs, {selected : job_name, header : 'jobs'}, true));
 					$('#divDetails').html($('#tmplDetails').render(job || group || report, {stats_keys_reduced : job ? stats_keys_reduced_job : group ? stats_keys_reduced_group : stats_keys_reduced_experiment, environ_keys_reduced : environ_keys_reduced}));
 					$('pre.log-output').each(function() {$(this).scrollTop(this.scrollHeight);});
+					return job || group || report;
+				};
+
+				var fetch_log_tail = function(obj, stream) {
+					$.ajax({url : 'log/' + stream + obj.qualified_name, dataType : 'text', headers : {Range : 'bytes=-' + report.log_tail_bytes}}).done(function(text, text_status, xhr) {
+						obj[stream] = (/^bytes [1-9]/.test(xhr.getResponseHeader('Content-Range')) ? '[...]\\n' : '') + text;
+						render();
+					}).fail(function() {obj[stream] = ''; render();});
+				};
+
+				$(window).on('hashchange', function() {
+					var obj = render();
+					if(report.live)
+						$.getJSON('report' + obj.qualified_name, function(details) {
+							$.extend(obj, details);
+							render();
+							fetch_log_tail(obj, 'stdout');
+							fetch_log_tail(obj, 'stderr');
+						});
 				}).trigger('hashchange');
+
+				if(report.live)
+					new EventSource('events').onmessage = function(event) {
+						$.each(JSON.parse(event.data), function(qualified_name, status) {
+							var selected = lookup(qualified_name);
+							(selected.job || selected.group || report).status = status;
+						});
+						render();
+					};
 			});
 		</script>
 	</body>
 </html>
 '''
 
-	e = e or init(config)
-
-	sgejoblogfiles = lambda group: [P.sgejoblogfiles(group, sgejob_idx) for sgejob_idx in range(len(group.jobs))]
-	sgejobfile = lambda group: [P.sgejobfile(group, sgejob_idx) for sgejob_idx in range(len(group.jobs))]
-	
-	truncate_stdout = lambda stdout: stdout[:config.max_stdout_size / 2] + '\n\n[%d characters skipped]\n\n' % (len(stdout) - 2 * (config.max_stdout_size / 2)) + stdout[-(config.max_stdout_size / 2):] if stdout != None and len(stdout) > config.max_stdout_size else stdout
-	exp_job_logs = {obj : (P.read_or_empty(log_paths[0]), Magic(P.read_or_empty(log_paths[1]))) for obj, log_paths in [(e, P.explogfiles())] + [(job, P.joblogfiles(job)) for job in e.jobs]}
-
-	def put_extra_job_stats(report_job):
-		if report_job['status'] == ExecutionStatus.running and 'time_started_unix' in report_job['stats']:
-			report_job['stats']['time_wall_clock_seconds'] = int(time.time()) - int(report_job['stats']['time_started_unix'])
-		return report_job
-
-	def put_extra_group_stats(report_group):
-		#wall_clock_seconds = filter(lambda x: x != None, [report_job['stats'].get('time_wall_clock_seconds') for report_job in report_group['jobs'] if report_job['status'] != ExecutionStatus.running])
-		#report_group['stats']['time_wall_clock_avg_seconds'] = float(sum(wall_clock_seconds)) / len(wall_clock_seconds) if wall_clock_seconds else None
-		return report_group
-
-	def process_results(results):
-		processed_results = []
-		for i, r in enumerate(results):
-			if not isinstance(r, dict):
-				r = {'type' : 'text', 'path' : r}
-			if r.get('name') == None and r.get('path') != None:
-				r['name'] = os.path.basename(r['path'])
-			if r['type'] == 'text' and r.get('value') == None and r.get('path') != None:
-				r['value'] = P.read_or_empty(r['path'])
-			if r.get('name') == None:
-				r['name'] = '#' + i
-			processed_results = filter(lambda rr: rr['name'] != r['name'], processed_results) + [r]
-		return sorted(processed_results, key = lambda item: item['name'])
-
-	report = {
-		'qualified_name' : '/',
-		'name' : e.experiment_name, 
-		'stdout' : exp_job_logs[e][0], 
-		'stdout_path' : P.explogfiles()[0],
-		'stderr' : exp_job_logs[e][1], 
-		'stderr_path' : P.explogfiles()[1],
-		'script' : P.read_or_empty(P.experiment_script), 
-		'script_path' : os.path.abspath(P.experiment_script),
-		'rcfile' : P.read_or_empty(P.rcfile) if P.rcfile != None else None,
-		'rcfile_path' : P.rcfile,
-		'environ' : exp_job_logs[e][1].environ(),
-		'env' : config.default_job_options.env,
-		'stats' : dict({
-			'experiment_root' : P.experiment_root,
-			'experiment_script' : os.path.abspath(P.experiment_script),
-			'rcfile' : P.rcfile,
-			'name_code' : P.experiment_name_code, 
-			'html_root' : P.html_root,
-			'html_root_alias' : P.html_root_alias,
-			'argv_joined' : ' '.join(['"%s"' % arg if ' ' in arg else arg for arg in sys.argv])}.items() +
-			{'default_job_options.' + k : v for k, v in vars(config.default_job_options).items()}.items() +
-			exp_job_logs[e][1].stats().items()
-		),
-		'groups' : [put_extra_group_stats({
-			'name' : group.name,
-			'qualified_name' : group.qualified_name, 
-			'stdout' : '\n'.join(map(P.read_or_empty, zip(*sgejoblogfiles(group))[0])).strip(),
-			'stdout_path' : '\n'.join(zip(*sgejoblogfiles(group))[0]),
-			'stderr' : '\n'.join(map(P.read_or_empty, zip(*sgejoblogfiles(group))[1])).strip(),
-			'stderr_path' : '\n'.join(zip(*sgejoblogfiles(group))[1]),
-			'env' : group.env,
-			'script' : '\n'.join(map(P.read_or_empty, sgejobfile(group))),
-			'status' : e.status(group),
-			'status_hint' : ('%d / %d' % ([job.status for job in group.jobs].count(ExecutionStatus.success), len(group.jobs))) if any([job.status in ExecutionStatus.processed for job in group.jobs]) else '',
-			'stats' : {
-				'mem_lo_gb' : group.mem_lo_gb, 
-				'mem_hi_gb' : group.mem_hi_gb,
-			},
-			'jobs' : [put_extra_job_stats({
-				'name' : job.name,
-				'qualified_name' : job.qualified_name, 
-				'group' : job.group.name,
-				'stdout' : truncate_stdout(exp_job_logs[job][0]),
-				'stdout_path' : P.joblogfiles(job)[0],
-				'stderr' : exp_job_logs[job][1], 
-				'stderr_path' : P.joblogfiles(job)[1],
-				'script' : P.read_or_empty(P.jobfile(job)),
-				'script_path' : P.jobfile(job),
-				'status' : job.status, 
-				'environ' : exp_job_logs[job][1].environ(),
-				'env' : job.env,
-				'results' : process_results(exp_job_logs[job][1].results()),
-				'stats' : exp_job_logs[job][1].stats()
-			}) for job in group.jobs],
-		}) for group in e.groups],
-		'index' : dict([(group.qualified_name, (group_idx, None)) for group_idx, group in enumerate(e.groups)] + [(job.qualified_name, (group_idx, job_idx)) for group, group_idx in enumerate(e.groups) for job_idx, job in enumerate(group.jobs)])
-	}
+	e = e or (init(config, snapshot = True, xpath = '/' if html else xpath) if restored == None else None)
 
 	if html:
+		report_json = json.dumps(restored or dict(report(config, e, logs = not live, live = live), live = live, log_tail_bytes = config.max_stdout_size), default = str)
+		html_report = HTML_PATTERN % (P.experiment_name_code, P.project_page, time.strftime(config.strftime), report_json)
+		if live or restored:
+			return html_report
 		if print_html_report_location:
 			print '%-30s %s' % ('Report will be at:', P.html_report_url)
-		report_json = json.dumps(report, default = str)
 		with open(P.html_report_file_path, 'w') as f:
-			f.write(HTML_PATTERN % (P.experiment_name_code, P.project_page, time.strftime(config.strftime), report_json))
+			f.write(html_report)
+			Profile.count('bytes_written', len(html_report))
 	else:
 		def truncate(d):
 			for truncate_key in ['stdout', 'stderr', 'script', 'rcfile']:
@@ -566,40 +910,84 @@ def status(config, e = None, xpath = None, html = False, print_html_report_locat
 				if truncate_key in d:
 					d[truncate_key] = '(%d elements) %s' % (len(d[truncate_key]), [elem['qualified_name'] for elem in d[truncate_key]])
 			return d
-		selected = ([elem for elem in (report['jobs'] + report['groups'] + [report]) if elem['qualified_name'] == xpath] or [{'error' : 'not found'} % xpath])[0]
-		print json.dumps(truncate(selected), default = str, indent = 2, sort_keys = True)
+		print json.dumps(truncate(report(config, e, xpath, logs = False, children = False)), default = str, indent = 2, sort_keys = True)
 
 def clean(config):
 	if os.path.exists(P.experiment_root):
 		shutil.rmtree(P.experiment_root)
 
-def stop(config, stderr = None):
-	print 'Stopping the experiment "%s"...' % P.experiment_name_code
-	Q.delete_jobs(Q.get_jobs(P.experiment_name_code, stderr = stderr), stderr = stderr)
-	while len(Q.get_jobs(P.experiment_name_code, stderr = stderr)) > 0:
-		print '%d jobs are still not deleted. Sleeping...' % len(Q.get_jobs(P.experiment_name_code, stderr = stderr))
+def stop(config, xpath = '/', stderr = None):
+	print 'Stopping the experiment "%s"%s...' % (P.experiment_name_code, ' (%s and its dependents)' % xpath if xpath != '/' else '')
+	e = init(config, snapshot = True)
+	obj = e.find(xpath)
+	if obj == None:
+		print 'Not found: %s' % xpath
+		return
+
+	dependents_of = collections.defaultdict(list) # keyed by job or group, a group dependency is triggered by any of its jobs
+	for job in e.jobs:
+		for dep in job.dependencies:
+			dependents_of[dep].append(job)
+	selected, frontier = set(e.select(obj)), collections.deque(e.select(obj))
+	while frontier:
+		job = frontier.popleft()
+		for dependent in dependents_of[job] + dependents_of[job.group]:
+			if dependent not in selected:
+				selected.add(dependent)
+				frontier.append(dependent)
+
+	jobs_to_cancel = [job for job in e.jobs if job in selected and job.status in [ExecutionStatus.waiting] + ExecutionStatus.enqueued]
+	for job in jobs_to_cancel:
+		with open(P.joblogfiles(job)[1], 'a') as f:
+			print >> f, Magic.echo(Magic.action_status, ExecutionStatus.canceled)
+	with open(P.canceled_file, 'a') as f:
+		f.write(''.join([job.qualified_name + '\n' for job in jobs_to_cancel]))
+
+	sgejob_names = set([P.sgejobname(group, sgejob_idx) for group in e.groups for sgejob_idx, job in enumerate(group.jobs) if job in selected])
+	get_sgejobs = lambda: [job_id for job_id, job_name in Q.get_named_jobs(P.experiment_name_code, stderr = stderr) if obj == e or job_name in sgejob_names]
+	sgejobs = get_sgejobs()
+	print 'Canceled %d jobs, deleting %d queue jobs.' % (len(jobs_to_cancel), len(sgejobs))
+	waiting = bool(sgejobs or jobs_to_cancel) # the scheduler may submit a canceled job before it reads the canceled file
+	while waiting:
+		Q.delete_jobs(sgejobs, stderr = stderr)
 		time.sleep(config.seconds_between_queue_checks)
+		sgejobs = get_sgejobs()
+		waiting = bool(sgejobs)
+		if sgejobs:
+			print '%d jobs are still not deleted. Sleeping...' % len(sgejobs)
 	print 'Done.\n'
 	
-def init(config):
-	e = Experiment(os.path.basename(P.experiment_script))
-	vars(sys.modules[__tool_name__]).update({m : getattr(e, m) for m in dir(e)})
-	exec open(P.experiment_script, 'r').read() in config.experiment_script_scope
-
-	def makedirs_if_does_not_exist(d):
-		if not os.path.exists(d):
-			os.makedirs(d)
+def init(config, snapshot = False, xpath = '/', new_layout = False):
+	e = Experiment.load(P.snapshot_file, P.snapshot_key()) if snapshot else None
+	if e == None:
+		e = Experiment(os.path.basename(P.experiment_script))
+		vars(sys.modules[__tool_name__]).update({m : getattr(e, m) for m in dir(e)})
+		exec open(P.experiment_script, 'r').read() in config.experiment_script_scope
+
+		def makedirs_if_does_not_exist(d):
+			if not os.path.exists(d):
+				os.makedirs(d)
+			
+		for d in P.all_dirs:
+			makedirs_if_does_not_exist(d)
 		
-	for d in P.all_dirs:
-		makedirs_if_does_not_exist(d)
-	
-	for group in e.groups:
-		makedirs_if_does_not_exist(P.logdir(group))
-		makedirs_if_does_not_exist(P.jobdir(group))
-		makedirs_if_does_not_exist(P.sgejobdir(group))
+		if new_layout:
+			P.shard_levels = {group.name : P.shard_levels_for(4 * len(group.jobs)) for group in e.groups} # two job logs and two sgejob logs per job
 
-	for job in e.jobs:
-		job.status = Magic(P.read_or_empty(P.joblogfiles(job)[1])).status() or job.status
+		for group in e.groups:
+			makedirs_if_does_not_exist(P.logdir(group))
+			makedirs_if_does_not_exist(P.jobdir(group))
+			makedirs_if_does_not_exist(P.sgejobdir(group))
+
+		for d in set([os.path.dirname(log_path) for group in e.groups for sgejob_idx, job in enumerate(group.jobs) for log_path in P.joblogfiles(job) + P.sgejoblogfiles(group, sgejob_idx)]):
+			makedirs_if_does_not_exist(d)
+
+	obj = xpath and e.find(xpath)
+	for job in (e.select(obj) if obj else []):
+		job_stderr = Magic(P.read_or_empty(P.joblogfiles(job)[1]))
+		job.status = job_stderr.status() or job.status
+		if job.status in ExecutionStatus.completed:
+			e.collect(job, job_stderr.stats())
 
 	return e
 
@@ -628,7 +1016,10 @@ def run(config, dry, locally, notify_enabled, archive_enabled):
 
 	clean(config)
 
-	e = init(config)
+	e = init(config, new_layout = True)
+	e.save(P.snapshot_file, P.snapshot_key())
+	with open(P.layout_file(), 'w') as f:
+		f.write(''.join(['%s %d\n' % item for item in sorted(P.shard_levels.items())]))
 	
 	for p in [p for job in e.jobs for p in get_used_paths(job) if p.domakedirs == True and not os.path.exists(str(p))]:
 		os.makedirs(str(p))
@@ -650,12 +1041,12 @@ def run(config, dry, locally, notify_enabled, archive_enabled):
 					''
 				]))
 
-				for job in job.group.jobs[sgejob_idx : sgejob_idx + 1]:
+				for job in group.jobs[sgejob_idx : sgejob_idx + 1]:
 					job_stderr_path = P.joblogfiles(job)[1]
 					f.write('\n'.join([
 						''
 						'# %s' % job.qualified_name,
-						'echo "' + qq(Magic.echo(Magic.action_status, ExecutionStatus.running)) + '" > "%s"' % job_stderr_path,
+						'echo "' + qq(Magic.echo(Magic.action_status, ExecutionStatus.running)) + '" >> "%s"' % job_stderr_path,
 						'echo "' + qq(Magic.echo(Magic.action_stats, {
 							'time_started' : "$(date +'%s')" % config.strftime,
 							'time_started_unix' : "$(date +'%s')",
@@ -665,8 +1056,9 @@ def run(config, dry, locally, notify_enabled, archive_enabled):
 						})) + '" >> "%s"' % job_stderr_path,
 						'''python -c "import json, os; print('%s %s ' + json.dumps(dict(os.environ)))" >> "%s"''' % (Magic.prefix, Magic.action_environ, job_stderr_path),
 						'''/usr/bin/time -f '%s %s {"exit_code" : %%x, "time_user_seconds" : %%U, "time_system_seconds" : %%S, "time_wall_clock_seconds" : %%e, "rss_max_kbytes" : %%M, "rss_avg_kbytes" : %%t, "page_faults_major" : %%F, "page_faults_minor" : %%R, "io_inputs" : %%I, "io_outputs" : %%O, "context_switches_voluntary" : %%w, "context_switches_involuntary" : %%c, "cpu_percentage" : "%%P", "signals_received" : %%k}' bash -e "%s" > "%s" 2>> "%s"''' % ((Magic.prefix.replace('%', '%%'), Magic.action_stats, P.jobfile(job)) + P.joblogfiles(job)),
-						'''([ "$?" == "0" ] && (echo "%s") || (echo "%s")) >> "%s"''' % (qq(Magic.echo(Magic.action_status, ExecutionStatus.success)), qq(Magic.echo(Magic.action_status, ExecutionStatus.error)), job_stderr_path),
-						'echo "' + qq(Magic.echo(Magic.action_stats, {'time_finished' : "$(date +'%s')" % config.strftime})) + '" >> "%s"' % job_stderr_path,
+						'JOB_EXIT_CODE="$?"',
+						'echo "' + qq(Magic.echo(Magic.action_stats, {'time_finished' : "$(date +'%s')" % config.strftime, 'time_finished_unix' : "$(date +'%s')"})) + '" >> "%s"' % job_stderr_path, # stats must precede the status line, the scheduler folds them as soon as it sees the status
+						'''([ "$JOB_EXIT_CODE" == "0" ] && (echo "%s") || (echo "%s")) >> "%s"''' % (qq(Magic.echo(Magic.action_status, ExecutionStatus.success)), qq(Magic.echo(Magic.action_status, ExecutionStatus.error)), job_stderr_path),
 						'# end',
 					]))
 
@@ -689,50 +1081,152 @@ def run(config, dry, locally, notify_enabled, archive_enabled):
 				FAILED_JOB = ([job.name for job in e.jobs if job.status in ExecutionStatus.failed] or [None])[0],
 				EXCEPTION_MESSAGE = exception_message
 			)
+			Profile.count('subprocess_forks')
 			print 'Exit code: %d' % subprocess.call(cmd, shell = True, stdout = experiment_stderr_file, stderr = experiment_stderr_file)
 		if archive_enabled:
 			archive(config, e)
 
-	def put_status(job, status):
+	def put_magic(job, action, arg):
+		line = Magic.echo(action, arg)
 		with open(P.joblogfiles(job)[1], 'a') as f:
-			print >> f, Magic.echo(Magic.action_status, status)
+			print >> f, line
+		Profile.count('bytes_written', len(line))
+
+	def put_status(job, status):
+		put_magic(job, Magic.action_status, status)
 		job.status = status
 
-	def update_status():
-		active_jobs = [job for sgejob in Q.get_jobs(P.experiment_name_code, stderr = experiment_stderr_file) for job in sgejob2job[sgejob]]
-		for job in filter(lambda job: job.status in ExecutionStatus.enqueued, e.jobs):
-			job.status = Magic(P.read_or_empty(P.joblogfiles(job)[1])).status() or job.status
-			if job.status == ExecutionStatus.running and job not in active_jobs:
+	def put_stats(job, stats):
+		put_magic(job, Magic.action_stats, stats)
+
+	def put_profile_stats(force = False):
+		if force or time.time() - put_profile_stats.last_time >= config.seconds_between_profile_stats:
+			print >> experiment_stderr_file, Magic.echo(Magic.action_stats, Profile.stats())
+			experiment_stderr_file.flush()
+			put_profile_stats.last_time = time.time()
+	put_profile_stats.last_time = time.time()
+
+	@Profile.timed('update_status')
+	def update_status(changed_paths = None):
+		check_queue = time.time() - update_status.last_queue_check >= config.seconds_between_queue_checks
+		if check_queue:
+			active_jobs = set([job for sgejob in Q.get_jobs(P.experiment_name_code, stderr = experiment_stderr_file) for job in sgejob2job.get(sgejob, [])])
+			update_status.last_queue_check = time.time()
+
+		changed = False
+		if os.path.exists(P.canceled_file) and os.path.getsize(P.canceled_file) > update_status.canceled_offset:
+			with open(P.canceled_file, 'r') as f:
+				f.seek(update_status.canceled_offset)
+				canceled = f.read()
+			canceled = canceled[:canceled.rfind('\n') + 1]
+			update_status.canceled_offset += len(canceled)
+			canceled = set(canceled.splitlines())
+			for job in filter(lambda job: job.qualified_name in canceled and job.status in [ExecutionStatus.waiting] + ExecutionStatus.enqueued, e.jobs):
+				job.status = ExecutionStatus.canceled
+				jobs_to_compress.append(job)
+				changed = True
+
+		for job in filter(lambda job: job.status in ExecutionStatus.enqueued and (log_changed(job) or check_queue if changed_paths == None else check_queue or P.joblogfiles(job)[1] in changed_paths), e.jobs):
+			job_stderr = Magic(P.read_or_empty(P.joblogfiles(job)[1]))
+			job_status = job_stderr.status() or job.status
+			changed = changed or job_status != job.status
+			job.status = job_status
+			if check_queue and job not in active_jobs and (job.status == ExecutionStatus.running or (job.status == ExecutionStatus.submitted and update_status.last_queue_check - job2time_submitted[job] >= config.seconds_between_queue_checks)):
 				put_status(job, ExecutionStatus.killed)
-			if job.status in ExecutionStatus.failed:
+				changed = True
+			if job.status in ExecutionStatus.completed:
+				e.collect(job, job_stderr.stats())
+				jobs_to_compress.append(job)
+			if job.status in ExecutionStatus.crashed:
 				for job_to_cancel in filter(lambda job: job.status == ExecutionStatus.waiting, e.jobs):
 					put_status(job_to_cancel, ExecutionStatus.canceled)
+					jobs_to_compress.append(job_to_cancel)
+
+		if check_queue:
+			compress_logs_of(filter(lambda job: job not in active_jobs, jobs_to_compress))
 		
-		status(config, e, html = True)
+		put_profile_stats()
+		if changed or check_queue:
+			status(config, e, html = True)
+		return changed
+	update_status.last_queue_check, update_status.canceled_offset = 0, 0
+
+	def log_changed(job):
+		try:
+			stat = os.stat(P.joblogfiles(job)[1])
+		except OSError:
+			return False
+		changed, job2log_stat[job] = job2log_stat.get(job) != (stat.st_size, stat.st_mtime), (stat.st_size, stat.st_mtime)
+		return changed
+
+	def compress_logs_of(jobs):
+		for job in jobs:
+			jobs_to_compress.remove(job)
+			if not config.no_compress_logs:
+				map(compress_queue.put, P.joblogfiles(job) + P.sgejoblogfiles(job.group, job2sgejob_idx[job]))
+
+	def compress_forever():
+		while True:
+			file_path = compress_queue.get()
+			if file_path == None:
+				break
+			try:
+				P.compress(file_path)
+			except (IOError, OSError), err:
+				print >> experiment_stderr_file, 'Could not compress "%s": %s' % (file_path, err)
+			finally:
+				compress_queue.task_done()
+
+	def wait_for_status(block = True):
+		wait_for_status.changed = update_status(watcher.wait(block, backoff = not wait_for_status.changed))
+	wait_for_status.changed = True
 
 	def wait_if_more_jobs_than(num_jobs):
-		if len([job for job in e.jobs if job.status in ExecutionStatus.enqueued]) < num_jobs:
-			return
-		while len(Q.get_jobs(P.experiment_name_code, stderr = experiment_stderr_file)) > num_jobs:
-			time.sleep(config.seconds_between_queue_checks)
-			update_status()
+		while len([job for job in e.jobs if job.status in ExecutionStatus.enqueued]) > num_jobs:
+			wait_for_status()
 
 	is_job_submittable = lambda job: job.status == ExecutionStatus.waiting and all(map(lambda dep: e.status(dep) == ExecutionStatus.success, job.dependencies))
 	unhandled_exception_hook.notification_hook = lambda exception_message: notify_if_needed(ExecutionStatus.error, exception_message)
 
-	sgejob2job = {}
-	print >> experiment_stderr_file, '\n'.join([Magic.echo(Magic.action_stats, {'time_started' : time.strftime(config.strftime)}), Magic.echo(Magic.action_environ, dict(os.environ))])
-	while e.status() not in ExecutionStatus.failed and any(map(is_job_submittable, e.jobs)):
-		job_to_submit = filter(is_job_submittable, e.jobs)[0]
-		group, sgejob_idx = job_to_submit.group, job.group.jobs.index(job_to_submit)
-		sgejob = Q.submit_job(P.sgejobfile(group, sgejob_idx), '%s_%s_%s' % (P.experiment_name_code, group.name, sgejob_idx), stderr = experiment_stderr_file)
+	if Q.daemon_socket:
+		Q.call_daemon('register')
+
+	sgejob2job, job2time_submitted, job2log_stat = {}, {}, {}
+	job2sgejob_idx = {job : idx for group in e.groups for idx, job in enumerate(group.jobs)}
+	jobs_to_compress, compress_queue = [], Queue.Queue()
+	compressor = threading.Thread(target = compress_forever)
+	compressor.daemon = True
+	compressor.start()
+
+	watcher = Watcher(sorted(set([os.path.dirname(P.joblogfiles(job)[1]) for job in e.jobs])), config.watcher, config.seconds_between_log_checks_min, config.seconds_between_queue_checks, accept = lambda file_name: file_name.startswith('stderr_job_'))
+	print >> experiment_stderr_file, '\n'.join([Magic.echo(Magic.action_stats, {'time_started' : time.strftime(config.strftime), 'watcher' : watcher.backend}), Magic.echo(Magic.action_environ, dict(os.environ))])
+	while e.status() not in ExecutionStatus.crashed and any([is_job_submittable(job) or job.status in ExecutionStatus.enqueued for job in e.jobs]):
+		job_to_submit = (filter(is_job_submittable, e.jobs) or [None])[0]
+		if job_to_submit == None:
+			wait_for_status()
+			continue
+		group = job_to_submit.group
+		job2time_submitted[job_to_submit] = time.time()
+		put_stats(job_to_submit, {'time_submitted_unix' : int(job2time_submitted[job_to_submit])})
+		sgejob = Q.submit_job(P.sgejobfile(group, job2sgejob_idx[job_to_submit]), P.sgejobname(group, job2sgejob_idx[job_to_submit]), stderr = experiment_stderr_file)
 		sgejob2job[sgejob] = [job_to_submit]
 		job_to_submit.status = ExecutionStatus.submitted
 		wait_if_more_jobs_than(config.parallel_jobs - 1)
-		update_status()
+		wait_for_status(block = False)
 	wait_if_more_jobs_than(0)
 	print >> experiment_stderr_file, Magic.echo(Magic.action_stats, {'time_finished' : time.strftime(config.strftime)})
+	put_profile_stats(force = True)
 	update_status()
+	compress_deadline = time.time() + 3 * config.seconds_between_queue_checks
+	while jobs_to_compress and time.time() < compress_deadline: # a job script still appends to its log until it leaves the queue
+		wait_for_status()
+	if jobs_to_compress:
+		print >> experiment_stderr_file, 'Leaving logs of %d jobs uncompressed, they are still in the queue: %s' % (len(jobs_to_compress), ' '.join([job.qualified_name for job in jobs_to_compress]))
+	compress_queue.join()
+	compress_queue.put(None)
+	compressor.join()
+	if Q.daemon_socket:
+		Q.call_daemon('unregister')
 	
 	notify_and_archive(e.status())
 	print ''
@@ -741,20 +1235,441 @@ def run(config, dry, locally, notify_enabled, archive_enabled):
 def resume(config, dry, locally, notify_enabled, archive_enabled):
 	pass
 
-def log(config, xpath, stdout = True, stderr = True):
-	e = init(config)
+def log(config, xpath, stdout = True, stderr = True, follow = False, lines = None):
+	e = init(config, snapshot = True, xpath = None)
 
 	obj = e.find(xpath)
 	log_slice = slice(0 if stdout else 1, 2 if stderr else 1)
-	log_paths = P.joblogfiles(obj)[log_slice] if isinstance(obj, Job) else [l for sgejob_idx in range([job.group for job in e.jobs].count(obj)) for l in P.sgejoblogfiles(obj, sgejob_idx)[log_slice]] if isinstance(obj, Group) else P.explogfiles()[log_slice]
+	if not follow and lines == None:
+		log_paths = P.joblogfiles(obj)[log_slice] if isinstance(obj, Job) else [l for sgejob_idx in range([job.group for job in e.jobs].count(obj)) for l in P.sgejoblogfiles(obj, sgejob_idx)[log_slice]] if isinstance(obj, JobGroup) else P.explogfiles()[log_slice]
+
+		Profile.count('subprocess_forks')
+		subprocess.call('gzip -cdf "%s" | less' % '" "'.join([existing_file_path for log_path in log_paths for existing_file_path in P.existing_files(log_path)]), shell = True)
+		return
+
+	streams = ['stdout', 'stderr'][log_slice]
+	labeled = lambda obj, log_paths: [dict(label = obj.qualified_name + ('' if len(streams) == 1 else ' ' + stream), path = log_path, offset = 0, partial = '') for stream, log_path in zip(streams, log_paths[log_slice])]
+	log_files = (labeled(e, P.explogfiles()) if obj == e else []) + [log_file for job in (e.select(obj) if obj != None else []) for log_file in labeled(job, P.joblogfiles(job))]
+	path2log_file = {log_file['path'] : log_file for log_file in log_files}
+	lines = 10 if lines == None else max(0, lines)
+	handles, max_open_handles, block_size, max_partial_line = collections.OrderedDict(), 256, 65536, 65536
+
+	def put_line(log_file, line):
+		sys.stdout.write('[%s] %s\n' % (log_file['label'], line))
+
+	def tail_offset(f, num_lines):
+		f.seek(0, os.SEEK_END)
+		end = offset = f.tell()
+		if num_lines == 0:
+			return end
+		while offset > 0:
+			read_size = min(block_size, offset)
+			offset -= read_size
+			f.seek(offset)
+			block = f.read(read_size)
+			i = len(block)
+			while True:
+				i = block.rfind('\n', 0, i)
+				if i < 0:
+					break
+				if offset + i != end - 1:
+					num_lines -= 1
+					if num_lines == 0:
+						return offset + i + 1
+		return 0
+
+	def open_handle(log_file):
+		f = handles.pop(log_file['path'], None) or open(log_file['path'])
+		handles[log_file['path']] = f
+		while len(handles) > max_open_handles:
+			handles.popitem(last = False)[1].close()
+		return f
+
+	def close_handle(log_file):
+		f = handles.pop(log_file['path'], None)
+		if f != None:
+			f.close()
+
+	def consume(log_file, f, size = None):
+		while size == None or size > log_file['offset']:
+			chunk = f.read(block_size if size == None else min(block_size, size - log_file['offset']))
+			if not chunk:
+				break
+			log_file['offset'] += len(chunk)
+			chunk_lines = (log_file['partial'] + chunk).split('\n')
+			log_file['partial'] = chunk_lines.pop()
+			if len(log_file['partial']) > max_partial_line:
+				chunk_lines.append(log_file['partial'])
+				log_file['partial'] = ''
+			for line in chunk_lines:
+				put_line(log_file, line)
+
+	def read_new(log_file):
+		compressed_path = P.compressed_file(log_file['path'])
+		try:
+			size = os.path.getsize(log_file['path'])
+		except OSError:
+			close_handle(log_file)
+			if os.path.exists(compressed_path):
+				with contextlib.closing(gzip.open(compressed_path)) as f:
+					f.seek(log_file['offset'])
+					consume(log_file, f)
+				if log_file['partial']:
+					put_line(log_file, log_file['partial'])
+				log_file['offset'], log_file['partial'] = None, ''
+			return
+
+		if size < log_file['offset']:
+			close_handle(log_file)
+			log_file['offset'], log_file['partial'] = 0, ''
+		if size > log_file['offset']:
+			f = open_handle(log_file)
+			f.seek(log_file['offset'])
+			consume(log_file, f, size)
+
+	def read_lines(file_paths):
+		for file_path in file_paths:
+			with contextlib.closing((gzip.open if file_path.endswith('.gz') else open)(file_path)) as f:
+				for line in f:
+					yield line
+
+	for log_file in log_files:
+		if os.path.exists(P.compressed_file(log_file['path'])):
+			log_file['offset'] = None
+			for line in collections.deque(read_lines(P.existing_files(log_file['path'])), maxlen = lines):
+				put_line(log_file, line.rstrip('\n'))
+		elif os.path.exists(log_file['path']):
+			log_file['offset'] = tail_offset(open_handle(log_file), lines)
+			read_new(log_file)
+			if not follow and log_file['partial']:
+				put_line(log_file, log_file['partial'])
+		sys.stdout.flush()
+
+	try:
+		if follow:
+			log_dirs = sorted(set([os.path.dirname(log_file['path']) for log_file in log_files]))
+			watcher = Watcher(log_dirs, config.watcher if all(map(os.path.isdir, log_dirs)) else 'poll', config.seconds_between_log_checks_min, config.seconds_between_queue_checks)
+			changed = True
+			while any([log_file['offset'] != None for log_file in log_files]):
+				changed_paths = watcher.wait(backoff = not changed)
+				changed = False
+				for log_file in (log_files if changed_paths == None else filter(None, map(path2log_file.get, changed_paths))):
+					if log_file['offset'] != None:
+						offset = log_file['offset']
+						read_new(log_file)
+						changed = changed or log_file['offset'] != offset
+				sys.stdout.flush()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		for log_file in log_files:
+			close_handle(log_file)
+
+def serve(config, host, port):
+	e = init(config, snapshot = True)
+	state = dict(version = 0, deltas = collections.deque(maxlen = 1024), index = (None, None))
+	condition = threading.Condition()
+	all_statuses = lambda: {obj.qualified_name : e.status(obj) for obj in e.jobs + e.groups + [e]}
+	job2log_stat = {}
+
+	def poll():
+		while True:
+			time.sleep(config.seconds_between_queue_checks)
+			changed = []
+			for job in filter(lambda job: job.status not in ExecutionStatus.completed + [ExecutionStatus.canceled], e.jobs):
+				try:
+					log_stat = [(file_path, os.path.getsize(file_path), os.path.getmtime(file_path)) for file_path in P.existing_files(P.joblogfiles(job)[1])]
+				except OSError:
+					continue
+				if job2log_stat.get(job) == log_stat:
+					continue
+				job2log_stat[job] = log_stat
+				job_stderr = Magic(P.read_or_empty(P.joblogfiles(job)[1]))
+				job_status = job_stderr.status() or job.status
+				if job_status != job.status:
+					job.status = job_status
+					changed.append(job)
+					if job.status in ExecutionStatus.completed:
+						e.collect(job, job_stderr.stats())
+			delta = {obj.qualified_name : e.status(obj) for obj in changed + list(set([job.group for job in changed])) + ([e] if changed else [])}
+			with condition:
+				if delta:
+					state['version'] += 1
+					state['deltas'].append((state['version'], delta))
+				condition.notify_all()
+
+	class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+		log_message = lambda self, format, *args: None
+
+		def send(self, code, content_type, body, headers = {}):
+			self.send_response(code)
+			for k, v in [('Content-Type', content_type), ('Content-Length', len(body))] + headers.items():
+				self.send_header(k, v)
+			self.end_headers()
+			self.wfile.write(body)
+			Profile.count('bytes_written', len(body))
+
+		def do_GET(self):
+			path = urlparse.urlparse(self.path).path
+			if path == '/':
+				with condition:
+					version, (index_version, index) = state['version'], state['index']
+				if index_version != version:
+					index = status(config, e, html = True, live = True) # rendered from in-memory statuses and aggregates, outside the lock
+					with condition:
+						if state['index'][0] < version:
+							state['index'] = (version, index)
+				self.send(200, 'text/html', index)
+			elif path.startswith('/report/'):
+				if e.find(path[len('/report'):]) == None:
+					return self.send(404, 'text/plain', 'not found: %s' % path)
+				details = report(config, e, path[len('/report'):], logs = False, children = False)
+				self.send(200, 'application/json', json.dumps({k : v for k, v in details.items() if k not in ['jobs', 'groups', 'index']}, default = str))
+			elif path.startswith('/log/') and path.count('/') >= 3:
+				stream, xpath = path.split('/', 3)[2:]
+				obj = e.find(xpath)
+				log_paths = [P.joblogfiles(obj)] if isinstance(obj, Job) else [P.sgejoblogfiles(obj, sgejob_idx) for sgejob_idx in range(len(obj.jobs))] if isinstance(obj, JobGroup) else [P.explogfiles()] if obj == e else None
+				if log_paths == None or stream not in ['stdout', 'stderr']:
+					return self.send(404, 'text/plain', 'not found: %s' % path)
+				self.send_log([log_path[['stdout', 'stderr'].index(stream)] for log_path in log_paths])
+			elif path == '/events':
+				self.send_events()
+			else:
+				self.send(404, 'text/plain', 'not found: %s' % path)
+
+		def send_log(self, file_paths):
+			parts = [(existing_file_path, P.file_size(existing_file_path)) for file_path in file_paths for existing_file_path in P.existing_files(file_path)] # a group's log is the concatenation of its sgejob logs
+			file_size = sum([part_size for existing_file_path, part_size in parts])
+			byte_range = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+			if byte_range and byte_range.group(1):
+				begin, end = int(byte_range.group(1)), min(file_size - 1, int(byte_range.group(2) or file_size - 1))
+			elif byte_range and byte_range.group(2):
+				begin, end = max(0, file_size - int(byte_range.group(2))), file_size - 1
+			else:
+				begin, end = 0, file_size - 1
+			if byte_range and begin > end:
+				return self.send(416, 'text/plain', '', {'Content-Range' : 'bytes */%d' % file_size})
+			chunks, part_begin = [], 0
+			for existing_file_path, part_size in parts:
+				if part_begin <= end and begin < part_begin + part_size:
+					with contextlib.closing((gzip.open if existing_file_path.endswith('.gz') else open)(existing_file_path, 'rb')) as f:
+						f.seek(max(0, begin - part_begin))
+						chunks.append(f.read(min(end + 1, part_begin + part_size) - max(begin, part_begin)))
+				part_begin += part_size
+			chunk = ''.join(chunks)
+			Profile.count('bytes_read', len(chunk))
+			self.send(206 if byte_range else 200, 'text/plain', chunk, {'Content-Range' : 'bytes %d-%d/%d' % (begin, end, file_size)} if byte_range else {'Accept-Ranges' : 'bytes'})
+
+		def send_events(self):
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/event-stream')
+			self.send_header('Cache-Control', 'no-cache')
+			self.end_headers()
+			version = state['version']
+			try:
+				while True:
+					with condition:
+						condition.wait()
+						behind = bool(state['deltas']) and state['deltas'][0][0] > version + 1
+						deltas = [delta for delta_version, delta in state['deltas'] if delta_version > version]
+						version = state['version']
+					delta = all_statuses() if behind else reduce(lambda acc, cur: dict(acc, **cur), deltas, {})
+					self.wfile.write('data: %s\n\n' % json.dumps(delta) if delta else ':\n\n')
+					self.wfile.flush()
+			except socket.error:
+				pass
+
+	poller = threading.Thread(target = poll)
+	poller.daemon = True
+	poller.start()
+
+	class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+		daemon_threads = True
+
+	server = Server((host, port), Handler)
+	print '%-30s %s' % ('Serving the dashboard at:', 'http://%s:%d/' % (host or socket.getfqdn(), server.server_address[1]))
+	server.serve_forever()
+
+def daemon(config, global_jobs):
+	Q.daemon_socket = None
+	state = dict(jobs = [], submitted = [], experiments = set(), pending = [], granted = 0, active = collections.Counter())
+	condition = threading.Condition()
+
+	def recount():
+		experiment_of = lambda job_name: ([experiment for experiment in state['experiments'] if job_name.startswith(experiment + '_')] or [None])[0]
+		state['active'] = collections.Counter(filter(bool, [experiment_of(job_name) for job_id, job_name in state['jobs']]))
+		condition.notify_all()
+
+	def poll():
+		tic = time.time()
+		jobs = Q.qstat(stderr = sys.stderr)
+		with condition:
+			state['submitted'] = [(job, submitted_at) for job, submitted_at in state['submitted'] if submitted_at >= tic]
+			state['jobs'] = jobs + [job for job, submitted_at in state['submitted'] if job not in jobs]
+			recount()
+
+	def poll_forever():
+		while True:
+			time.sleep(config.seconds_between_queue_checks)
+			poll()
+
+	def submit_job(request):
+		ticket = dict(experiment = request['experiment'], time = time.time())
+		with condition:
+			state['experiments'].add(ticket['experiment'])
+			state['pending'].append(ticket)
+			while sum(state['active'].values()) + state['granted'] >= global_jobs or ticket is not min(state['pending'], key = lambda t: (state['active'][t['experiment']], t['time'])):
+				condition.wait(config.seconds_between_queue_checks)
+				if request['client_closed']():
+					state['pending'].remove(ticket)
+					condition.notify_all()
+					return None
+			state['pending'].remove(ticket)
+			state['granted'] += 1
+		try:
+			job = (Q.submit_job(request['sgejob_file'], request['sgejob_name'], stderr = sys.stderr), request['sgejob_name'])
+		finally:
+			with condition:
+				state['granted'] -= 1
+		if request['client_closed']():
+			Q.delete_jobs([job[0]], stderr = sys.stderr)
+			return None
+		with condition:
+			state['submitted'].append((job, time.time()))
+			state['jobs'].append(job)
+			recount()
+		return job[0]
+
+	def delete_jobs(request):
+		Q.delete_jobs(request['jobs'], stderr = sys.stderr)
+		with condition:
+			state['jobs'] = [(job_id, job_name) for job_id, job_name in state['jobs'] if job_id not in request['jobs']]
+			recount()
+
+	def register(request, registered):
+		with condition:
+			(state['experiments'].add if registered else state['experiments'].discard)(request['experiment'])
+			recount()
+
+	methods = dict(
+		ping = lambda request: True,
+		register = lambda request: register(request, True),
+		unregister = lambda request: register(request, False),
+		get_jobs = lambda request: [(job_id, job_name) for job_id, job_name in state['jobs'] if job_name.startswith(request['job_name_prefix'])],
+		submit_job = submit_job,
+		delete_jobs = delete_jobs
+	)
+
+	class Handler(SocketServer.StreamRequestHandler):
+		def client_closed(self):
+			try:
+				return bool(select.select([self.connection], [], [], 0)[0]) and not self.connection.recv(1, socket.MSG_PEEK)
+			except socket.error:
+				return True
+
+		def handle(self):
+			line = self.rfile.readline()
+			if not line:
+				return
+			request = dict(json.loads(line), client_closed = self.client_closed)
+			try:
+				response = {'result' : methods[request['method']](request)}
+			except Exception, err:
+				response = {'error' : '%s: %s' % (type(err).__name__, err)}
+			if self.client_closed():
+				return
+			self.wfile.write(json.dumps(response) + '\n')
+
+		def finish(self):
+			try:
+				SocketServer.StreamRequestHandler.finish(self)
+			except socket.error:
+				pass # the client is gone, e.g. run was interrupted while waiting for a slot
 
-	subprocess.call('cat "%s" | less' % '" "'.join(log_paths), shell = True)
+	class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+		daemon_threads = True
 
-def archive(config, e = None):
-	e = e or init(config)
-	archive_report_file_path = P.archive_report_file_path(e.status(), time.localtime())
-	print '%-30s %s' % ('Archived report will be at:', archive_report_file_path)
-	shutil.copyfile(P.html_report_file_path, archive_report_file_path)
+	if os.path.exists(config.daemon_socket):
+		if socket.socket(socket.AF_UNIX, socket.SOCK_STREAM).connect_ex(config.daemon_socket) == 0:
+			print '%s daemon is already running at %s' % (__tool_name__, config.daemon_socket)
+			return
+		os.remove(config.daemon_socket)
+
+	poll()
+	poller = threading.Thread(target = poll_forever)
+	poller.daemon = True
+	poller.start()
+
+	server = Server(config.daemon_socket, Handler)
+	os.chmod(config.daemon_socket, 0600)
+	print '%-30s %s' % ('Daemon is listening at:', config.daemon_socket)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		print 'Quitting (Ctrl+C pressed).'
+	finally:
+		os.remove(config.daemon_socket)
+
+def open_archive_index():
+	db = sqlite3.connect(P.archive_index_file)
+	db.executescript('''
+		CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, experiment_name_code TEXT, status TEXT, time_archived_unix INTEGER, report_blob TEXT, stats TEXT);
+		CREATE TABLE IF NOT EXISTS jobs (run_id INTEGER, qualified_name TEXT, status TEXT, exit_code INTEGER, time_wall_clock_seconds REAL, rss_max_kbytes REAL, hostname TEXT, stats TEXT);
+		CREATE INDEX IF NOT EXISTS runs_experiment_name_code ON runs (experiment_name_code);
+		CREATE INDEX IF NOT EXISTS jobs_run_id_qualified_name ON jobs (run_id, qualified_name);
+	''')
+	return contextlib.closing(db)
+
+def archive(config, e = None, restore = None):
+	blob_min_size = 256
+
+	def put_blob(content):
+		content = content.encode('utf-8') if isinstance(content, unicode) else str(content)
+		digest = hashlib.sha1(content).hexdigest()
+		blob_file = P.compressed_file(P.archive_blob_file(digest))
+		if not os.path.exists(blob_file):
+			if not os.path.exists(os.path.dirname(blob_file)):
+				os.makedirs(os.path.dirname(blob_file))
+			with gzip.open(blob_file + '.tmp', 'wb') as f:
+				f.write(content)
+			os.rename(blob_file + '.tmp', blob_file)
+			Profile.count('bytes_written', len(content))
+		return digest
+
+	dedup = lambda obj: {'$blob' : put_blob(obj)} if isinstance(obj, basestring) and len(obj) >= blob_min_size else {k : dedup(v) for k, v in obj.items()} if isinstance(obj, dict) else map(dedup, obj) if isinstance(obj, list) else obj
+	undedup = lambda obj: P.read_or_empty(P.archive_blob_file(obj['$blob'])) if isinstance(obj, dict) and obj.keys() == ['$blob'] else {k : undedup(v) for k, v in obj.items()} if isinstance(obj, dict) else map(undedup, obj) if isinstance(obj, list) else obj
+
+	if restore != None:
+		with open_archive_index() as db:
+			row = db.execute('SELECT status, report_blob FROM runs WHERE run_id = ? AND experiment_name_code = ?', (restore, P.experiment_name_code)).fetchone()
+		if row == None:
+			print 'Run %d of experiment "%s" is not in the archive index.' % (restore, P.experiment_name_code)
+			return
+		archive_report_file_path = P.archive_report_file_path(restore, row[0])
+		with open(archive_report_file_path, 'w') as f:
+			f.write(status(config, html = True, restored = undedup(json.loads(P.read_or_empty(P.archive_blob_file(row[1]))))))
+		print '%-30s %s' % ('Restored report is at:', archive_report_file_path)
+		return
+
+	e = e or init(config, snapshot = True)
+	archived_report = report(config, e)
+	report_blob = put_blob(json.dumps(dedup(archived_report), default = str))
+	with open_archive_index() as db:
+		with db:
+			run_id = db.execute('INSERT INTO runs (experiment_name_code, status, time_archived_unix, report_blob, stats) VALUES (?, ?, ?, ?, ?)', (P.experiment_name_code, e.status(), int(time.time()), report_blob, json.dumps(archived_report['stats'], default = str))).lastrowid
+			db.executemany('INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [(run_id, report_job['qualified_name'], report_job['status'], report_job['stats'].get('exit_code'), report_job['stats'].get('time_wall_clock_seconds'), report_job['stats'].get('rss_max_kbytes'), report_job['stats'].get('hostname'), json.dumps(report_job['stats'], default = str)) for report_group in archived_report['groups'] for report_job in report_group['jobs']])
+	print '%-30s %s' % ('Archived run:', '%d (%s)' % (run_id, P.archive_index_file))
+
+def history(config, xpath):
+	with open_archive_index() as db:
+		if xpath == '/':
+			header, rows = ['run_id', 'status', 'time_archived', 'jobs_completed', 'time_wall_clock_median_seconds', 'rss_max_kbytes'], [row[:3] + tuple(json.loads(row[3]).get(k) for k in ['jobs_completed', 'time_wall_clock_median_seconds', 'rss_max_kbytes']) for row in db.execute('SELECT run_id, status, time_archived_unix, stats FROM runs WHERE experiment_name_code = ? ORDER BY run_id', (P.experiment_name_code, ))]
+		else:
+			header, rows = ['run_id', 'qualified_name', 'status', 'time_archived', 'exit_code', 'time_wall_clock_seconds', 'rss_max_kbytes', 'hostname'], db.execute('SELECT runs.run_id, jobs.qualified_name, jobs.status, runs.time_archived_unix, jobs.exit_code, jobs.time_wall_clock_seconds, jobs.rss_max_kbytes, jobs.hostname FROM jobs JOIN runs ON jobs.run_id = runs.run_id WHERE runs.experiment_name_code = ? AND (jobs.qualified_name = ? OR substr(jobs.qualified_name, 1, length(?)) = ?) ORDER BY runs.run_id, jobs.qualified_name', (P.experiment_name_code, xpath, xpath.rstrip('/') + '/', xpath.rstrip('/') + '/')).fetchall()
+	format_cell = lambda k, v: time.strftime(config.strftime, time.localtime(v)) if k == 'time_archived' and v != None else str(v)
+	print '\t'.join(header)
+	for row in rows:
+		print '\t'.join(itertools.starmap(format_cell, zip(header, row)))
 
 if __name__ == '__main__':
 	def unhandled_exception_hook(exc_type, exc_value, exc_traceback):
@@ -803,6 +1718,12 @@ if __name__ == '__main__':
 	run_parent.add_argument('--max_stdout_size', type = int, default = 2048)
 	run_parent.add_argument('--seconds_between_queue_checks', type = int, default = 2)
 	run_parent.add_argument('--seconds_before_automatic_stopping', type = int, default = 10)
+	run_parent.add_argument('--seconds_between_profile_stats', type = int, default = 60)
+	run_parent.add_argument('--seconds_between_log_checks_min', type = float, default = 0.25)
+	run_parent.add_argument('--watcher', choices = ['auto', 'inotify', 'poll'], default = 'auto')
+	run_parent.add_argument('--no_compress_logs', action = 'store_true')
+	run_parent.add_argument('--daemon', action = 'store_true')
+	run_parent.add_argument('--daemon_socket', default = os.path.expanduser('~/.%s.sock' % __tool_name__))
 	
 	parser_parent = argparse.ArgumentParser(parents = [run_parent], add_help = False)
 	parser_parent.add_argument('--rcfile', default = os.path.expanduser('~/.%src' % __tool_name__))
@@ -816,6 +1737,7 @@ if __name__ == '__main__':
 
 	cmd = subparsers.add_parser('stop')
 	cmd.add_argument('experiment_script')
+	cmd.add_argument('--xpath', default = '/')
 	cmd.add_argument('--verbose', action = 'store_const',  dest = 'stderr', default = open(os.devnull, 'w'), const = None)
 	cmd.set_defaults(func = stop)
 
@@ -828,6 +1750,8 @@ if __name__ == '__main__':
 	cmd.add_argument('--xpath', default = '/')
 	cmd.add_argument('--stdout', action = 'store_false', dest = 'stderr')
 	cmd.add_argument('--stderr', action = 'store_false', dest = 'stdout')
+	cmd.add_argument('--follow', '-f', action = 'store_true')
+	cmd.add_argument('--lines', '-n', type = int)
 	cmd.set_defaults(func = log)
 
 	cmd = subparsers.add_parser('status')
@@ -843,6 +1767,7 @@ if __name__ == '__main__':
 	cmd.add_argument('--locally', action = 'store_true')
 	cmd.add_argument('--notify', action = 'store_true', dest = 'notify_enabled')
 	cmd.add_argument('--archive', action = 'store_true', dest = 'archive_enabled')
+	cmd.add_argument('--profile', action = 'store_true')
 	cmd.set_defaults(func = run)
 	
 	cmd = subparsers.add_parser('resume', parents = [run_parent])
@@ -853,9 +1778,26 @@ if __name__ == '__main__':
 	cmd.add_argument('--archive', action = 'store_true', dest = 'archive_enabled')
 	cmd.set_defaults(func = resume)
 
+	cmd = subparsers.add_parser('serve')
+	cmd.add_argument('experiment_script')
+	cmd.add_argument('--host', default = '')
+	cmd.add_argument('--port', type = int, default = 8080)
+	cmd.set_defaults(func = serve)
+
+	cmd = subparsers.add_parser('daemon')
+	cmd.add_argument('--global_jobs', type = int, default = 100)
+	cmd.add_argument('--daemon_socket', default = run_parent.get_default('daemon_socket'))
+	cmd.set_defaults(func = daemon)
+
 	cmd = subparsers.add_parser('archive')
 	cmd.add_argument('experiment_script')
+	cmd.add_argument('--restore', type = int)
 	cmd.set_defaults(func = archive)
+
+	cmd = subparsers.add_parser('history')
+	cmd.add_argument('experiment_script')
+	cmd.add_argument('--xpath', default = '/')
+	cmd.set_defaults(func = history)
 	
 	args = vars(parser.parse_args())
 	
@@ -872,11 +1814,19 @@ if __name__ == '__main__':
 	config.default_job_options = JobOptions(parent = config.default_job_options, **args) # updating config using command-line args
 	vars(config).update({k : args.pop(k) or v for k, v in vars(config).items() if k in args}) # removing all keys from args except the method args
 	
-	P.init(config, args.pop('experiment_script'))
+	if 'experiment_script' in args:
+		P.init(config, args.pop('experiment_script'))
+	if config.daemon and args['func'] != daemon:
+		Q.connect_daemon(config.daemon_socket)
+	func, profiler = args.pop('func'), cProfile.Profile() if args.pop('profile', False) else None
 	try:
-		args.pop('func')(config, **args)
+		profiler.runcall(func, config, **args) if profiler else func(config, **args)
 	except KeyboardInterrupt:
 		print 'Quitting (Ctrl+C pressed). To stop jobs:'
 		print ''
 		print '%s stop "%s"' % (__tool_name__, P.experiment_script)
 		print ''
+	finally:
+		if profiler:
+			profiler.dump_stats(P.profile_file())
+			print '%-30s %s' % ('Profile was saved to:', P.profile_file())